@@ -0,0 +1,418 @@
+import asyncio
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from copy import copy
+from string import ascii_uppercase
+
+import plotly.io as pio
+import polars as pl
+import polars.selectors as cs
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from .plot import plot_profile, plot_scenario_levels
+from .utils import (
+    DiveProfile,
+    compute_scenarios,
+    compute_tank_levels,
+    scenario_tanks,
+    widen_tank_levels,
+)
+
+# Columns of compute_scenarios describing the batch rather than the profile
+BATCH_COLUMNS = ["scenario", "volume", "pressure", "tank_volume", "tank_pressure"]
+
+# Conso with one pressure column per tank, and tank levels of a profile
+Result = tuple[pl.DataFrame, pl.DataFrame]
+
+
+class ConsoBatcher:
+
+    def __init__(
+        self, max_wait: float = 0.005, max_batch: int = 256, cache_size: int = 1024
+    ):
+        """
+        Initialize a ConsoBatcher instance.
+        Profiles submitted by concurrent requests are gathered during
+        max_wait seconds and computed together in a single compute_scenarios
+        call, keyed on their hash so identical profiles are computed once.
+        Computations run in the default executor to keep the event loop free.
+        Parameters:
+        - max_wait: Time in seconds to wait for other profiles before computing.
+        - max_batch: Number of pending profiles triggering an immediate compute.
+        - cache_size: Number of computed profiles and figures kept in memory.
+        Returns:
+        - None : Initializes an empty batch and cache.
+        """
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, Result] = OrderedDict()
+        self._figures: OrderedDict[str, dict] = OrderedDict()
+        self._pending: dict[str, tuple[DiveProfile, asyncio.Future]] = {}
+        self._running: dict[str, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    async def compute(self, dps: dict[str, DiveProfile]) -> dict[str, Result]:
+        """
+        Compute the conso of dive profiles along with other pending requests.
+        Parameters:
+        - dps: Dive profiles keyed on their hash.
+        Returns:
+        - compute_profiles result of each profile keyed on its hash.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for key, dp in dps.items():
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                futures[key] = loop.create_future()
+                futures[key].set_result(self._cache[key])
+            elif key in self._pending:
+                futures[key] = self._pending[key][1]
+            elif key in self._running:
+                futures[key] = self._running[key]
+            else:
+                futures[key] = loop.create_future()
+                self._pending[key] = (dp, futures[key])
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        # shield shared futures so a cancelled request does not cancel others
+        results = await asyncio.gather(*map(asyncio.shield, futures.values()))
+        return dict(zip(futures.keys(), results))
+
+    async def figure(
+        self,
+        key: str,
+        dps: list[tuple[str, DiveProfile]],
+        results: dict[str, Result],
+    ) -> dict:
+        """
+        Build the figure of computed dive profiles.
+        Parameters:
+        - key: Hash identifying the figure.
+        - dps: Hash and dive profile of each submitted profile, in request order.
+        - results: compute_profiles result of each profile keyed on its hash.
+        Returns:
+        - Plotly figure as a JSON compatible dict.
+        """
+        if key in self._figures:
+            self._figures.move_to_end(key)
+            return self._figures[key]
+        loop = asyncio.get_running_loop()
+        figure = await loop.run_in_executor(None, build_figure, dps, results)
+        self._figures[key] = figure
+        while len(self._figures) > self.cache_size:
+            self._figures.popitem(last=False)
+        return figure
+
+    def _flush(self) -> None:
+        """
+        Send all pending profiles to be computed in a single pass.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        self._running.update({key: future for key, (_, future) in pending.items()})
+        task = asyncio.ensure_future(self._resolve(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(
+        self, pending: dict[str, tuple[DiveProfile, asyncio.Future]]
+    ) -> None:
+        """
+        Compute profiles in the executor and resolve their futures.
+        """
+        loop = asyncio.get_running_loop()
+        dps = {key: dp for key, (dp, _) in pending.items()}
+        try:
+            results = await loop.run_in_executor(None, compute_profiles, dps)
+        except Exception as error:
+            results = {key: error for key in dps}
+
+        for key, (_, future) in pending.items():
+            del self._running[key]
+            result = results[key]
+            if isinstance(result, Exception):
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            self._cache[key] = result
+            if not future.done():
+                future.set_result(result)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+def compute_profiles(
+    dps: dict[str, DiveProfile],
+) -> dict[str, Result | Exception]:
+    """
+    Compute the conso of dive profiles in a single pass.
+
+    Parameters:
+    - dps: Dive profiles keyed on their hash.
+
+    Returns:
+    - Conso with a bar_remaining_<tank> column per tank of the profile and
+    tank levels of each profile keyed on its hash, or the error raised by
+    the profile. Profiles are computed one by one when the batch fails so
+    that a bad profile does not fail the others, and profiles whose values
+    overflow to infinity get a ValueError.
+    """
+    try:
+        df = compute_scenarios(dps)
+        levels = compute_tank_levels(df, scenario_tanks(dps), by="scenario")
+    except Exception:
+        if len(dps) == 1:
+            raise
+        results = {}
+        for key, dp in dps.items():
+            try:
+                results.update(compute_profiles({key: dp}))
+            except Exception as error:
+                results[key] = error
+        return results
+
+    # Tank levels are only widened over the tanks of each profile
+    tank_levels = levels.partition_by("scenario", as_dict=True)
+    results = {}
+    for (key,), part in df.partition_by("scenario", as_dict=True).items():
+        result = (widen_tank_levels(part, tank_levels[(key,)]), tank_levels[(key,)])
+        if all(is_finite(frame) for frame in result):
+            results[key] = result
+        else:
+            results[key] = ValueError("Profile values are too large to compute.")
+    return results
+
+
+def is_finite(df: pl.DataFrame) -> bool:
+    """
+    Check that all the float values of a dataframe are finite.
+
+    Parameters:
+    - df: Dataframe to check, null values are ignored.
+
+    Returns:
+    - True if no float value is infinite or NaN.
+    """
+    return all(df.select(cs.float().is_finite().all()).row(0))
+
+
+def build_figure(
+    dps: list[tuple[str, DiveProfile]], results: dict[str, Result]
+) -> dict:
+    """
+    Build the figure of computed dive profiles without computing them again.
+
+    Parameters:
+    - dps: Hash and dive profile of each submitted profile, in request order.
+    - results: compute_profiles result of each profile keyed on its hash.
+
+    Returns:
+    - Plotly figure of the profile, or comparison figure of the profiles
+    with one scenario per submitted profile, as a JSON compatible dict.
+    """
+    if len(dps) == 1:
+        # copy the profile to give it the computed conso columns
+        key, dp = dps[0]
+        dp = copy(dp)
+        dp.profile = results[key][0].drop(BATCH_COLUMNS)
+        fig = plot_profile(dp=dp)
+    else:
+        df, levels = (
+            pl.concat(
+                [
+                    results[key][part].with_columns(
+                        scenario=pl.lit(f"Scenario {i + 1}")
+                    )
+                    for i, (key, _) in enumerate(dps)
+                ],
+                how="diagonal_relaxed",
+            )
+            for part in [0, 1]
+        )
+        fig = plot_scenario_levels(df=df, levels=levels)
+    return json.loads(pio.to_json(fig))
+
+
+def hash_profile(profile: dict) -> str:
+    """
+    Compute the hash identifying a dive profile request.
+
+    Parameters:
+    - profile: Dive profile as received by the API.
+
+    Returns:
+    - Hexadecimal sha256 digest of the profile values.
+    """
+    values = {
+        "time": [float(t) for t in profile["time"]],
+        "depth": [float(d) for d in profile["depth"]],
+        "conso": [float(c) for c in profile["conso"]],
+        "volume": float(profile.get("volume", 12.0)),
+        "pressure": float(profile.get("pressure", 200.0)),
+        "tank": profile.get("tank"),
+        "tanks": {
+            name: [float(volume), float(pressure)]
+            for name, (volume, pressure) in profile.get("tanks", {}).items()
+        },
+    }
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def check_profile(profile: dict) -> None:
+    """
+    Check that a dive profile request can be computed.
+
+    Parameters:
+    - profile: Dive profile as received by the API.
+
+    Returns:
+    - None : Raise a ValueError if the profile is not valid.
+    """
+    lengths = {len(profile[key]) for key in ["time", "depth", "conso"]}
+    if "tank" in profile:
+        lengths.add(len(profile["tank"]))
+    if len(lengths) != 1:
+        raise ValueError("Profile time, depth, conso and tank must have same length.")
+    n_segments = lengths.pop()
+    if not 0 < n_segments <= len(ascii_uppercase):
+        raise ValueError(
+            f"Profile must have between 1 and {len(ascii_uppercase)} segments."
+        )
+
+    tanks = {
+        "Bloc": (profile.get("volume", 12.0), profile.get("pressure", 200.0)),
+        **profile.get("tanks", {}),
+    }
+    values = [
+        *profile["time"],
+        *profile["depth"],
+        *profile["conso"],
+        *[value for tank in tanks.values() for value in tank],
+    ]
+    if not all(math.isfinite(float(value)) for value in values):
+        raise ValueError("Profile values must be finite numbers.")
+    if not all(float(volume) > 0 for volume, _ in tanks.values()):
+        raise ValueError("Tank volumes must be positive.")
+
+
+def parse_profiles(payload: dict) -> list[tuple[str, DiveProfile]]:
+    """
+    Build the dive profiles of an API request.
+
+    Parameters:
+    - payload: Request body, either a single profile or a list of profiles
+    under the 'profiles' key. A profile has 'time', 'depth' and 'conso'
+    lists and optional 'volume' and 'pressure' values. Stage and deco tanks
+    are given as 'tanks' with their [volume, pressure] and the 'tank' list
+    names the tank breathed on each segment.
+
+    Returns:
+    - Hash and dive profile of each submitted profile, in request order.
+    """
+    profiles = payload["profiles"] if "profiles" in payload else [payload]
+    if not isinstance(profiles, list) or len(profiles) == 0:
+        raise ValueError("Request must contain at least one profile.")
+
+    dps = []
+    for profile in profiles:
+        check_profile(profile)
+        dps.append(
+            (
+                hash_profile(profile),
+                DiveProfile(
+                    time=[float(t) for t in profile["time"]],
+                    depth=[float(d) for d in profile["depth"]],
+                    conso=[float(c) for c in profile["conso"]],
+                    volume=float(profile.get("volume", 12.0)),
+                    pressure=float(profile.get("pressure", 200.0)),
+                    tank=profile.get("tank"),
+                    extra_tanks=profile.get("tanks"),
+                ),
+            )
+        )
+    return dps
+
+
+async def conso(request: Request) -> Response:
+    """
+    Compute the conso of one or several dive profiles.
+
+    Parameters:
+    - request: POST request with a JSON body as described in parse_profiles,
+    an optional 'figure' boolean adds the plot of the profiles.
+
+    Returns:
+    - JSON response with the conso records and total conso of each profile,
+    in request order.
+    """
+    try:
+        payload = await request.json()
+        dps = parse_profiles(payload)
+        with_figure = payload.get("figure", False)
+        if not isinstance(with_figure, bool):
+            raise ValueError("Request 'figure' must be a boolean.")
+    except (KeyError, TypeError, ValueError, AttributeError) as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+
+    keys = [key for key, _ in dps]
+    etag = hashlib.sha256("".join([*keys, str(with_figure)]).encode()).hexdigest()
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    # identical profiles of the request are computed once
+    batcher = request.app.state.batcher
+    try:
+        results = await batcher.compute(dict(dps))
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    content = {
+        "profiles": [
+            {
+                "hash": key,
+                "total_conso": results[key][0]["conso_totale"][-1],
+                "segments": results[key][0].drop(BATCH_COLUMNS).to_dicts(),
+            }
+            for key in keys
+        ]
+    }
+    if with_figure:
+        content["figure"] = await batcher.figure(etag, dps, results)
+    return JSONResponse(content, headers=headers)
+
+
+def create_api(**batcher_kwargs) -> Starlette:
+    """
+    Create the JSON planning API.
+
+    Parameters:
+    - batcher_kwargs: Arguments passed to ConsoBatcher.
+
+    Returns:
+    - Starlette application serving POST /conso.
+    """
+    api = Starlette(routes=[Route("/conso", conso, methods=["POST"])])
+    api.state.batcher = ConsoBatcher(**batcher_kwargs)
+    return api
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_api(), host="127.0.0.1", port=8001)
@@ -2,19 +2,33 @@ import polars as pl
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from great_tables import GT, html
+from plotly.colors import qualitative
 from importlib_resources import files
-from .utils import DiveProfile
+from collections.abc import Mapping, Sequence
+from .utils import (
+    DiveProfile,
+    compute_scenarios,
+    compute_tank_levels,
+    scenario_tanks,
+)
+
+Scenarios = Mapping[str, DiveProfile] | Sequence[DiveProfile]
+DASHES = ["dot", "dash", "dashdot", "longdash", "longdashdot"]  # Tank line styles
 
 
 def plot_profile(
-    dp: DiveProfile, x: str = "time", y1: str = "depth", y2: str = "bar_remaining"
+    dp: DiveProfile | Scenarios,
+    x: str = "time",
+    y1: str = "depth",
+    y2: str = "bar_remaining",
 ) -> go.FigureWidget:
     """
     Create the Dive Profile plot.
     Parameters
     ----------
-    dp : DiveProfile
-        A DiveProfile object containing the dive data.
+    dp : DiveProfile | Scenarios
+        A DiveProfile object containing the dive data, or a collection of
+        DiveProfile objects to overlay in a comparison plot.
     x : str
         Column name for the x-axis (default is "time").
     y1 : str
@@ -26,19 +40,27 @@ def plot_profile(
     go.FigureWidget
         A Plotly FigureWidget containing the dive profile plot.
     """
+    if not isinstance(dp, DiveProfile):
+        return plot_scenarios(dps=dp, x=x, y1=y1, y2=y2)
+
+    # Show one pressure trace per tank when the dive uses several tanks
+    tanks = dp.tanks
+    tank_columns = [f"bar_remaining_{name}" for name in tanks] if len(tanks) > 1 else []
+
     # Add initial time point to dataframe
     initial_state = pl.DataFrame(
         {
             "time": [0.0],
             "depth": [0.0],
             "bar_remaining": float(dp.pressure),
+            **{f"bar_remaining_{name}": float(p) for name, (_, p) in tanks.items()},
         }
     )
     df = pl.concat([initial_state, dp.profile], how="diagonal_relaxed")
 
     # Record max values for plot range
     max_depth = df.select(pl.max(y1)).item()
-    max_bar = df.select(pl.max(y2)).item()
+    max_bar = df.select(pl.max_horizontal(pl.max(y2, *tank_columns))).item()
     mean_depth = df.select(pl.mean(y1)).item()
 
     # Record middle point for time interval
@@ -60,10 +82,27 @@ def plot_profile(
 
     fig.update_traces(fill="tozeroy", line_color="rgba(0,100,80,0.2)")
 
-    fig.add_trace(
-        go.Scatter(x=df[x], y=df[y2], name="Bloc pressure", line=dict(color="navy")),
-        secondary_y=True,
-    )
+    if tank_columns:
+        palette = qualitative.Dark24
+        fig.add_traces(
+            [
+                go.Scatter(
+                    x=df[x],
+                    y=df[column],
+                    name=f"{name} pressure",
+                    line=dict(color=palette[i % len(palette)]),
+                )
+                for i, (name, column) in enumerate(zip(tanks, tank_columns))
+            ],
+            secondary_ys=[True] * len(tank_columns),
+        )
+    else:
+        fig.add_trace(
+            go.Scatter(
+                x=df[x], y=df[y2], name="Bloc pressure", line=dict(color="navy")
+            ),
+            secondary_y=True,
+        )
 
     fig.add_trace(
         go.Scatter(
@@ -102,16 +141,25 @@ def plot_profile(
     return go.FigureWidget(fig)
 
 
-def format_profile(dp: DiveProfile) -> GT:
+def format_profile(dp: DiveProfile | Scenarios) -> GT:
     """
     Format the dive profile DataFrame for display.
 
     Parameters:
-    - df: DataFrame containing the dive profile.
+    - dp: DiveProfile containing the dive data, or a collection of
+    DiveProfile objects to summarise in a comparison table.
 
     Returns:
     - Formatted DataFrame with rounded values.
     """
+    if not isinstance(dp, DiveProfile):
+        return format_scenarios(dps=dp)
+
+    # Show the tank and the reserve of each tank when the dive uses several
+    tanks = dp.tanks
+    tank_columns = [f"bar_remaining_{name}" for name in tanks] if len(tanks) > 1 else []
+    segment_columns = ["tank"] if tank_columns else []
+
     # Add starting point
     initial_state = pl.DataFrame(
         {
@@ -123,6 +171,7 @@ def format_profile(dp: DiveProfile) -> GT:
             "conso_totale": [0.0],
             "segment": ["Start"],
             "conso_per_min": [None],
+            **{f"bar_remaining_{name}": [float(p)] for name, (_, p) in tanks.items()},
         }
     )
     df = pl.concat([initial_state, dp.profile], how="diagonal_relaxed")
@@ -141,6 +190,7 @@ def format_profile(dp: DiveProfile) -> GT:
     )
 
     required_columns = {"conso_totale", "conso_remaining", "bar_remaining"}
+    required_columns.update(tank_columns)
     table_output = df.with_columns(
         pl.col(required_columns).clip(lower_bound=0).round(0)
     ).select(
@@ -150,9 +200,11 @@ def format_profile(dp: DiveProfile) -> GT:
             "speed",
             "time_interval",
             "depth",
+            *segment_columns,
             "bar_remaining",
             "conso_remaining",
             "conso_per_min",
+            *tank_columns,
         ]
     )
     table_output = (
@@ -165,12 +217,21 @@ def format_profile(dp: DiveProfile) -> GT:
                 "speed",
                 "time_interval",
                 "depth",
+                *segment_columns,
                 "conso_per_min",
                 "conso_remaining",
                 "bar_remaining",
+                *tank_columns,
             ]
         )
         .cols_label(
+            {
+                **{column: html("<b>Tank</b>") for column in segment_columns},
+                **{
+                    column: html(f"<b>{name}</b> (bar)")
+                    for name, column in zip(tanks, tank_columns)
+                },
+            },
             segment=html("<b>Segment</b>"),
             direction=html("<b>Direction</b>"),
             speed=html("<b>Speed</b> (m/min)"),
@@ -186,7 +247,7 @@ def format_profile(dp: DiveProfile) -> GT:
             file_pattern="logo-diver-{}.svg",
         )
         .data_color(
-            columns=["bar_remaining"],
+            columns=["bar_remaining", *tank_columns],
             palette=["firebrick", "lightcoral"],
             domain=[0, 50],
             na_color="white",
@@ -206,3 +267,206 @@ def format_profile(dp: DiveProfile) -> GT:
         .sub_missing(missing_text="")
     )
     return table_output
+
+
+def plot_scenarios(
+    dps: Scenarios, x: str = "time", y1: str = "depth", y2: str = "bar_remaining"
+) -> go.FigureWidget:
+    """
+    Create the comparison plot overlaying several dive profiles.
+    Parameters
+    ----------
+    dps : Scenarios
+        DiveProfile objects to compare, named in a mapping or in a sequence.
+    x : str
+        Column name for the x-axis (default is "time").
+    y1 : str
+        Column name for the first y-axis (default is "depth").
+    y2 : str
+        Column name of the tank levels for the second y-axis (default is
+        "bar_remaining").
+    Returns
+    -------
+    go.FigureWidget
+        A Plotly FigureWidget with one depth trace per profile and one
+        pressure trace per tank of each profile.
+    """
+    df = compute_scenarios(dps)
+    levels = compute_tank_levels(df, scenario_tanks(dps), by="scenario")
+    return plot_scenario_levels(df=df, levels=levels, x=x, y1=y1, y2=y2)
+
+
+def plot_scenario_levels(
+    df: pl.DataFrame,
+    levels: pl.DataFrame,
+    x: str = "time",
+    y1: str = "depth",
+    y2: str = "bar_remaining",
+) -> go.FigureWidget:
+    """
+    Create the comparison plot from dive profiles already computed.
+    Parameters
+    ----------
+    df : pl.DataFrame
+        Conso of the dive profiles from compute_scenarios.
+    levels : pl.DataFrame
+        Tank levels of the dive profiles from compute_tank_levels.
+    x : str
+        Column name for the x-axis (default is "time").
+    y1 : str
+        Column name for the first y-axis (default is "depth").
+    y2 : str
+        Column name of the tank levels for the second y-axis (default is
+        "bar_remaining").
+    Returns
+    -------
+    go.FigureWidget
+        A Plotly FigureWidget with one depth trace per profile and one
+        pressure trace per tank of each profile.
+    """
+    # Add initial time point of each scenario and tank, tanks start full
+    initial_state = df.unique("scenario", keep="first", maintain_order=True).select(
+        "scenario", pl.lit(0.0).alias(x), pl.lit(0.0).alias(y1)
+    )
+    df = pl.concat([initial_state, df], how="diagonal_relaxed")
+    initial_levels = levels.unique(
+        ["scenario", "tank"], keep="first", maintain_order=True
+    ).select(
+        "scenario", "tank", pl.lit(0.0).alias(x), pl.col("tank_pressure").alias(y2)
+    )
+    levels = pl.concat([initial_levels, levels], how="diagonal_relaxed")
+    several_tanks = (
+        levels.select(pl.col("tank").n_unique().over("scenario").max()).item() > 1
+    )
+
+    # Record max values for plot range
+    max_depth = df.select(pl.max(y1)).item()
+    max_bar = levels.select(pl.max(y2)).item()
+
+    # Build all traces before adding them to the figure at once
+    palette = qualitative.Dark24
+    tank_levels = levels.partition_by("scenario", as_dict=True)
+    traces, secondary_ys = [], []
+    for i, ((name,), scenario) in enumerate(
+        df.partition_by("scenario", maintain_order=True, as_dict=True).items()
+    ):
+        color = palette[i % len(palette)]
+        traces.append(
+            go.Scatter(
+                x=scenario[x],
+                y=scenario[y1],
+                name=name,
+                legendgroup=name,
+                line=dict(color=color),
+            )
+        )
+        secondary_ys.append(False)
+        for j, ((tank,), level) in enumerate(
+            tank_levels[(name,)]
+            .partition_by("tank", maintain_order=True, as_dict=True)
+            .items()
+        ):
+            traces.append(
+                go.Scatter(
+                    x=level[x],
+                    y=level[y2],
+                    name=f"{name} - {tank}" if several_tanks else name,
+                    legendgroup=name,
+                    showlegend=False,
+                    line=dict(color=color, dash=DASHES[j % len(DASHES)]),
+                )
+            )
+            secondary_ys.append(True)
+
+    # Create figure with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_traces(traces, secondary_ys=secondary_ys)
+
+    # Add figure title
+    fig.update_layout(
+        title=dict(text="Dive Profile Comparison", font=dict(size=20, weight=900)),
+        template="plotly_white",
+    )
+
+    # Set x-axis title
+    fig.update_xaxes(title_text="<b>Dive time</b> (min)")
+
+    # Set y-axes titles
+    fig.update_yaxes(
+        title_text="<b>Depth</b> (m)",
+        range=[max_depth, 0],
+        secondary_y=False,
+    )
+    fig.update_yaxes(
+        title_text=(
+            "<b>Tank pressure</b> (bar, one dash style per tank)"
+            if several_tanks
+            else "<b>Bloc pressure</b> (bar, dotted)"
+        ),
+        range=[0, max_bar],
+        secondary_y=True,
+    )
+
+    return go.FigureWidget(fig)
+
+
+def format_scenarios(dps: Scenarios) -> GT:
+    """
+    Format the final reserves of several dive profiles for comparison.
+
+    Parameters:
+    - dps: DiveProfile objects to compare, named in a mapping or in a sequence.
+
+    Returns:
+    - Formatted DataFrame with one row per profile and the pressure
+    difference with the first profile. Reserves are the ones of the
+    emptiest tank for profiles using several tanks.
+    """
+    df = compute_scenarios(dps)
+
+    # Final reserve of each tank, then of the emptiest tank of each scenario
+    reserves = (
+        df.group_by("scenario", "tank", maintain_order=True)
+        .agg(pl.last("conso_remaining"), pl.last("bar_remaining"))
+        .sort("bar_remaining")
+        .group_by("scenario")
+        .agg(pl.first("conso_remaining"), pl.first("bar_remaining"))
+    )
+    table_output = (
+        df.group_by("scenario", maintain_order=True)
+        .agg(
+            pl.first("volume"),
+            pl.first("pressure"),
+            pl.last("time"),
+            pl.max("depth"),
+        )
+        .join(reserves, on="scenario", how="left", maintain_order="left")
+        .with_columns(
+            pl.col("conso_remaining", "bar_remaining").clip(lower_bound=0).round(0)
+        )
+        .with_columns(
+            bar_diff=pl.col("bar_remaining") - pl.first("bar_remaining"),
+        )
+    )
+    reference = table_output["scenario"][0]
+    table_output = (
+        GT(table_output)
+        .tab_header(title="Dive Profile Comparison")
+        .cols_label(
+            scenario=html("<b>Scenario</b>"),
+            volume=html("<b>Bloc</b> (L)"),
+            pressure=html("<b>Pressure</b> (bar)"),
+            time=html("<b>Dive time</b> (min)"),
+            depth=html("<b>Max depth</b> (m)"),
+            conso_remaining=html("<b>Air remaining</b> (L)"),
+            bar_remaining=html("<b>Pressure remaining</b> (bar)"),
+            bar_diff=html(f"<b>Difference</b> with {reference} (bar)"),
+        )
+        .data_color(
+            columns=["bar_remaining"],
+            palette=["firebrick", "lightcoral"],
+            domain=[0, 50],
+            na_color="white",
+        )
+    )
+    return table_output
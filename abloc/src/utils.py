@@ -2,6 +2,9 @@ import polars as pl
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from string import ascii_uppercase
+from collections.abc import Mapping, Sequence
+
+MAIN_TANK = "Bloc"  # Name of the tank defined by volume and pressure
 
 
 class DiveProfile:
@@ -13,25 +16,48 @@ class DiveProfile:
         conso: list[float],
         volume: float = 12.0,
         pressure: float = 200.0,
+        tank: list[str] | None = None,
+        extra_tanks: dict[str, tuple[float, float]] | None = None,
     ):
         """
         Initialize a DiveProfile instance.
         Parameters:
         - time: Time interval in minutes.
         - depth: Depth in meters.
+        - tank: Name of the tank breathed on each segment, defaults to the
+        main tank defined by volume and pressure.
+        - extra_tanks: Volume and pressure of the stage and deco tanks.
         Returns:
         - None : Initializes the dive profile with time, depth, and segment labels.
         """
+        self.volume = volume  # Block volume in liters
+        self.pressure = pressure  # Pressure in bar
+        self.extra_tanks = dict(extra_tanks or {})  # Other tanks (volume, pressure)
+        if MAIN_TANK in self.extra_tanks:
+            raise ValueError(f"Tank name {MAIN_TANK} is reserved to the main tank.")
+        tank = tank if tank is not None else [MAIN_TANK] * len(time)
+        if len(tank) != len(time):
+            raise ValueError("Profile must name the tank of every segment.")
+        check_tanks(tank, self.tanks)
         self.profile = pl.DataFrame(
             {
                 "time_interval": time,  # (minutes),
                 "depth": depth,  # (meters),
                 "conso_per_min": conso,  # (liters per minute)
                 "segment": list(ascii_uppercase[: len(time)]),  # Segment labels
+                "tank": tank,  # Tank breathed on the segment
             }
         ).with_columns(time=pl.col("time_interval").cum_sum())
-        self.volume = volume  # Block volume in liters
-        self.pressure = pressure  # Pressure in bar
+
+    @property
+    def tanks(self) -> dict[str, tuple[float, float]]:
+        """
+        Get all the tanks of the dive, starting with the main tank.
+
+        Returns:
+        - Volume in liters and pressure in bar of each tank.
+        """
+        return {MAIN_TANK: (self.volume, self.pressure), **self.extra_tanks}
 
     @property
     def total_conso(self) -> float:
@@ -51,8 +77,20 @@ class DiveProfile:
         Returns:
         - None : Updates the profile with conso and remaining conso.
         """
+        tanks = self.tanks
         self.profile = compute_conso_from_profile(self.profile)
-        self.profile = compute_remaining_conso(self.profile, self.volume, self.pressure)
+        self.profile = compute_remaining_conso(
+            self.profile,
+            volume=pl.col("tank").replace_strict(
+                {name: float(v) for name, (v, _) in tanks.items()},
+                return_dtype=pl.Float64,
+            ),
+            pressure=pl.col("tank").replace_strict(
+                {name: float(p) for name, (_, p) in tanks.items()},
+                return_dtype=pl.Float64,
+            ),
+        )
+        self.profile = compute_tank_pressure(self.profile, tanks)
 
     def update_time(self) -> None:
         """
@@ -63,7 +101,12 @@ class DiveProfile:
         self.profile = self.profile.with_columns(time=pl.col("time_interval").cum_sum())
 
     def update_segment(
-        self, segment: str, time_interval: float, depth: float, conso: float
+        self,
+        segment: str,
+        time_interval: float,
+        depth: float,
+        conso: float,
+        tank: str | None = None,
     ) -> None:
         """
         Update a specific segment of the dive profile.
@@ -72,11 +115,15 @@ class DiveProfile:
         - time_interval: New time in minutes for the segment.
         - depth: New depth in meters for the segment.
         - conso: New consumption rate in liters per minute for the segment.
+        - tank: New tank breathed on the segment, by default the segment keeps
+        its tank and a new segment uses the main tank.
         Returns:
         - None : Update the specified segment with new time and depth.
         """
+        if tank is not None:
+            check_tanks([tank], self.tanks)
         self.profile = edit_segment_time_depth(
-            self.profile, segment, time_interval, depth, conso
+            self.profile, segment, time_interval, depth, conso, tank
         )
 
     def delete_segment(self, segment: str) -> None:
@@ -97,23 +144,192 @@ class DiveProfile:
             raise ValueError(f"Segment {segment} does not exist in the profile.")
 
 
-def compute_conso_from_profile(df: pl.DataFrame) -> pl.DataFrame:
+class ProfileHistory:
+
+    def __init__(
+        self,
+        dp: DiveProfile,
+        max_versions: int = 50,
+        max_bytes: int = 16 * 1024**2,
+    ):
+        """
+        Initialize a ProfileHistory instance.
+        Versions are stored as DiveProfile snapshots that are never mutated
+        once recorded. As DiveProfile edits replace the polars frame rather
+        than modifying it in place, consecutive versions share their
+        unchanged column buffers, including the computed conso columns.
+        Parameters:
+        - dp: Initial dive profile.
+        - max_versions: Maximum number of versions kept in memory.
+        - max_bytes: Maximum memory of the versions kept, measured with the
+        polars estimated_size of each profile. Shared buffers are counted in
+        every version using them, so this is an upper bound of the memory.
+        Returns:
+        - None : Initializes the history with the initial dive profile.
+        """
+        if max_versions < 1:
+            raise ValueError("History must keep at least one version.")
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self._versions = [dp]
+        self._sizes = [dp.profile.estimated_size()]  # Memory of each version
+        self._index = 0  # Position of the current version in _versions
+        self._evicted = 0  # Number of versions dropped from the history
+
+    @property
+    def current(self) -> DiveProfile:
+        """
+        Get the current version of the dive profile.
+
+        Returns:
+        - Current DiveProfile.
+        """
+        return self._versions[self._index]
+
+    @property
+    def version(self) -> int:
+        """
+        Get the number of the current version.
+
+        Returns:
+        - Version number, counted from the initial profile.
+        """
+        return self._evicted + self._index
+
+    @property
+    def versions(self) -> list[int]:
+        """
+        Get the numbers of the versions still held in the history.
+
+        Returns:
+        - List of version numbers.
+        """
+        return list(range(self._evicted, self._evicted + len(self._versions)))
+
+    @property
+    def size(self) -> int:
+        """
+        Get the memory of the versions held in the history.
+
+        Returns:
+        - Sum of the estimated size of each version in bytes.
+        """
+        return sum(self._sizes)
+
+    @property
+    def can_undo(self) -> bool:
+        """
+        Check whether a previous version is available.
+
+        Returns:
+        - True if undo is possible.
+        """
+        return self._index > 0
+
+    @property
+    def can_redo(self) -> bool:
+        """
+        Check whether a next version is available.
+
+        Returns:
+        - True if redo is possible.
+        """
+        return self._index < len(self._versions) - 1
+
+    def push(self, dp: DiveProfile) -> None:
+        """
+        Record a new version of the dive profile.
+        Parameters:
+        - dp: New dive profile, it must not be modified afterwards.
+        Returns:
+        - None : Drop the redo versions, add the new one and evict the oldest
+        versions above max_versions or max_bytes. The new version is always kept.
+        """
+        del self._versions[self._index + 1 :]
+        del self._sizes[self._index + 1 :]
+        self._versions.append(dp)
+        self._sizes.append(dp.profile.estimated_size())
+        overflow = max(len(self._versions) - self.max_versions, 0)
+        size = sum(self._sizes[overflow:])
+        while size > self.max_bytes and overflow < len(self._versions) - 1:
+            size -= self._sizes[overflow]
+            overflow += 1
+        del self._versions[:overflow]
+        del self._sizes[:overflow]
+        self._evicted += overflow
+        self._index = len(self._versions) - 1
+
+    def undo(self) -> DiveProfile:
+        """
+        Move back to the previous version.
+
+        Returns:
+        - Previous DiveProfile.
+        """
+        if not self.can_undo:
+            raise ValueError("No previous version in the history.")
+        self._index -= 1
+        return self.current
+
+    def redo(self) -> DiveProfile:
+        """
+        Move forward to the next version.
+
+        Returns:
+        - Next DiveProfile.
+        """
+        if not self.can_redo:
+            raise ValueError("No next version in the history.")
+        self._index += 1
+        return self.current
+
+    def goto(self, version: int) -> DiveProfile:
+        """
+        Move to a specific version.
+        Parameters:
+        - version: Version number to restore.
+        Returns:
+        - DiveProfile of the requested version.
+        """
+        index = version - self._evicted
+        if not 0 <= index < len(self._versions):
+            raise ValueError(f"Version {version} is not in the history.")
+        self._index = index
+        return self.current
+
+
+def compute_conso_from_profile(df: pl.DataFrame, by: str | None = None) -> pl.DataFrame:
     """
     Compute the air consumption based on the dive profile.
 
     Parameters:
     - df: DataFrame containing the dive profile with 'time' and 'depth' columns.
-    - conso: Consumption rate in liters per minute.
+    - by: Optional column identifying several profiles stacked in df,
+    computations are then done per profile.
 
     Returns:
     - polars dataframe with conso and cumulative conso columns.
     """
     # Compute the time relative to pressure (in bar)
     # result is expressed in surface time equivalent (in minutes)
+    init_depth = pl.col("depth").shift(fill_value=0)
+    conso_totale = pl.col("conso").cum_sum()
+    if by is not None:
+        init_depth = init_depth.over(by)
+        conso_totale = conso_totale.over(by)
+
+    # Conso is also accumulated per tank when segments name their tank
+    tank_columns = []
+    if "tank" in df.columns:
+        tanks = [by, "tank"] if by is not None else ["tank"]
+        tank_columns = [
+            pl.col("tank"),
+            pl.col("conso").cum_sum().over(tanks).alias("conso_tank"),
+        ]
 
     df = (
         df.with_columns(
-            init_bar=(pl.col("depth").shift(fill_value=0) / 10) + 1,
+            init_bar=(init_depth / 10) + 1,
             bar=(pl.col("depth") / 10) + 1,
         )
         .with_columns(
@@ -121,13 +337,15 @@ def compute_conso_from_profile(df: pl.DataFrame) -> pl.DataFrame:
         )
         .with_columns(conso=pl.col("trpz_area") * pl.col("conso_per_min"))
         .select(
+            *([pl.col(by)] if by is not None else []),
             pl.col("segment"),
             pl.col("time"),
             pl.col("time_interval"),
             pl.col("depth"),
             pl.col("conso"),
             pl.col("conso_per_min"),
-            pl.col("conso").cum_sum().alias("conso_totale"),
+            conso_totale.alias("conso_totale"),
+            *tank_columns,
         )
     )
     return df
@@ -150,33 +368,40 @@ def get_total_conso(df: pl.DataFrame) -> float:
 
 
 def compute_remaining_conso(
-    df: pl.DataFrame, volume: float, pressure: float
+    df: pl.DataFrame, volume: float | pl.Expr, pressure: float | pl.Expr
 ) -> pl.DataFrame:
     """
     Add the air consumption in bar to the dive profile.
 
     Parameters:
     - df: DataFrame containing the dive profile with conso_totale columns.
-    - volume: volume of the tank.
-    - pressure: pressure of the tank in bar.
+    - volume: volume of the tank, or an expression giving it per row.
+    - pressure: pressure of the tank in bar, or an expression giving it per row.
 
     Returns:
-    - polars dataframe with conso_remaining and bar_remining columns.
+    - polars dataframe with conso_remaining and bar_remining columns, for the
+    tank breathed on each segment when the profile has a conso_tank column.
     """
     if "conso_totale" not in df.columns:
         raise ValueError("Profile must have 'conso_totale' column to add bloc conso.")
+    used = pl.col("conso_tank" if "conso_tank" in df.columns else "conso_totale")
 
     # Create a new row with the last time and depth, and the new conso
     df = df.with_columns(
-        conso_remaining=((volume * pressure) - pl.col("conso_totale")),
-        bar_remaining=(pressure - (pl.col("conso_totale") / volume)),
+        conso_remaining=((volume * pressure) - used),
+        bar_remaining=(pressure - (used / volume)),
     )
 
     return df
 
 
 def edit_segment_time_depth(
-    df: pl.DataFrame, segment: str, time_interval: float, depth: float, conso: float
+    df: pl.DataFrame,
+    segment: str,
+    time_interval: float,
+    depth: float,
+    conso: float,
+    tank: str | None = None,
 ) -> pl.DataFrame:
     """
     Update a specific segment of the dive profile.
@@ -185,6 +410,7 @@ def edit_segment_time_depth(
     - time_interval: New time in minutes for the segment.
     - depth: New depth in meters for the segment.
     - conso: New consumption rate in liters per minute for the segment.
+    - tank: New tank for the segment, None keeps the current tank.
     Returns:
     - None : Update the specified segment with new time and depth.
     """
@@ -203,6 +429,13 @@ def edit_segment_time_depth(
             .otherwise("conso_per_min")
             .alias("conso_per_min"),
         )
+        if tank is not None:
+            df = df.with_columns(
+                pl.when(pl.col("segment") == segment)
+                .then(pl.lit(tank))
+                .otherwise("tank")
+                .alias("tank")
+            )
     else:
         # If the segment does not exist, create a new one
         new_segment = pl.DataFrame(
@@ -211,8 +444,215 @@ def edit_segment_time_depth(
                 "depth": [depth],
                 "segment": [ascii_uppercase[len(df)]],  # New segment label
                 "conso_per_min": [conso],  # New consumption rate
+                "tank": [tank if tank is not None else MAIN_TANK],  # Breathed tank
             }
         )
         df = pl.concat([df, new_segment], how="diagonal_relaxed")
 
     return df
+
+
+def as_scenarios(
+    dps: Mapping[str, DiveProfile] | Sequence[DiveProfile],
+) -> Mapping[str, DiveProfile]:
+    """
+    Name the dive profiles to compare.
+
+    Parameters:
+    - dps: Dive profiles, either named in a mapping or in a sequence, in
+    which case they are named "Scenario 1", "Scenario 2", etc.
+
+    Returns:
+    - Dive profiles keyed on their scenario name.
+    """
+    if not isinstance(dps, Mapping):
+        dps = {f"Scenario {i + 1}": dp for i, dp in enumerate(dps)}
+    if len(dps) == 0:
+        raise ValueError("At least one dive profile is required.")
+    return dps
+
+
+def scenario_tanks(
+    dps: Mapping[str, DiveProfile] | Sequence[DiveProfile],
+) -> pl.DataFrame:
+    """
+    List the tanks carried in each scenario.
+
+    Parameters:
+    - dps: Dive profiles to compare, named as in as_scenarios.
+
+    Returns:
+    - polars dataframe with scenario, tank, tank_volume and tank_pressure
+    columns, one row per tank of each scenario.
+    """
+    return pl.DataFrame(
+        [
+            (name, tank, float(volume), float(pressure))
+            for name, dp in as_scenarios(dps).items()
+            for tank, (volume, pressure) in dp.tanks.items()
+        ],
+        schema=["scenario", "tank", "tank_volume", "tank_pressure"],
+        orient="row",
+    )
+
+
+def compute_scenarios(
+    dps: Mapping[str, DiveProfile] | Sequence[DiveProfile],
+) -> pl.DataFrame:
+    """
+    Compute the air consumption of several dive profiles in a single pass.
+
+    Parameters:
+    - dps: Dive profiles to compare, either named in a mapping or in a
+    sequence, in which case they are named "Scenario 1", "Scenario 2", etc.
+
+    Returns:
+    - polars dataframe with the conso columns of all profiles stacked,
+    with scenario, volume and pressure columns identifying each profile
+    and its main tank, and the tank breathed on each segment with its
+    tank_volume and tank_pressure. The pressure of every tank is given by
+    compute_tank_levels.
+    """
+    dps = as_scenarios(dps)
+    scenarios = pl.DataFrame(
+        {
+            "scenario": list(dps.keys()),
+            "volume": [float(dp.volume) for dp in dps.values()],
+            "pressure": [float(dp.pressure) for dp in dps.values()],
+        }
+    )
+    df = pl.concat(
+        [
+            dp.profile.select(
+                pl.lit(name).alias("scenario"),
+                pl.col("segment"),
+                pl.col("tank"),
+                pl.col("time_interval").cast(pl.Float64),
+                pl.col("depth").cast(pl.Float64),
+                pl.col("conso_per_min").cast(pl.Float64),
+            )
+            for name, dp in dps.items()
+        ]
+    ).with_columns(time=pl.col("time_interval").cum_sum().over("scenario"))
+
+    df = (
+        compute_conso_from_profile(df, by="scenario")
+        .join(scenarios, on="scenario", how="left", maintain_order="left")
+        .join(
+            scenario_tanks(dps),
+            on=["scenario", "tank"],
+            how="left",
+            maintain_order="left",
+        )
+    )
+    return compute_remaining_conso(df, pl.col("tank_volume"), pl.col("tank_pressure"))
+
+
+def check_tanks(tank: list[str], tanks: Mapping[str, tuple[float, float]]) -> None:
+    """
+    Check that the segments only use known tanks.
+
+    Parameters:
+    - tank: Name of the tank breathed on each segment.
+    - tanks: Volume and pressure of the available tanks.
+
+    Returns:
+    - None : Raise a ValueError if a tank is unknown.
+    """
+    unknown = set(tank) - set(tanks)
+    if unknown:
+        raise ValueError(f"Tanks {sorted(unknown)} are not defined in the profile.")
+
+
+def compute_tank_levels(
+    df: pl.DataFrame, tanks: pl.DataFrame, by: str | None = None
+) -> pl.DataFrame:
+    """
+    Compute the remaining pressure of every tank along the dive profiles.
+
+    Parameters:
+    - df: DataFrame containing the dive profiles with segment, time, tank
+    and conso_tank columns.
+    - tanks: DataFrame with tank, tank_volume and tank_pressure columns, and
+    the by column when given.
+    - by: Optional column identifying several profiles stacked in df, each
+    with its own tanks.
+
+    Returns:
+    - polars dataframe in long format with one row per segment and tank
+    carried in the profile, with the segment, time, tank, tank_pressure and
+    bar_remaining columns. Tanks not breathed on a segment keep the pressure
+    they had after the last segment breathing them.
+    """
+    if "conso_tank" not in df.columns:
+        raise ValueError("Profile must have 'conso_tank' column to add tank levels.")
+    keys = [by] if by is not None else []
+
+    # Pair each segment with every tank of its profile
+    rows = df.select(
+        *keys, "segment", "time", pl.col("tank").alias("breathed"), "conso_tank"
+    )
+    if keys:
+        levels = rows.join(tanks, on=keys, how="inner", maintain_order="left_right")
+    else:
+        levels = rows.join(tanks, how="cross")
+
+    # Conso of each tank only changes on the segments breathing it
+    used = (
+        pl.when(pl.col("breathed") == pl.col("tank"))
+        .then(pl.col("conso_tank"))
+        .forward_fill()
+        .over([*keys, "tank"])
+        .fill_null(0.0)
+    )
+    return levels.select(
+        *keys,
+        "segment",
+        "time",
+        "tank",
+        "tank_pressure",
+        bar_remaining=pl.col("tank_pressure") - used / pl.col("tank_volume"),
+    )
+
+
+def widen_tank_levels(df: pl.DataFrame, levels: pl.DataFrame) -> pl.DataFrame:
+    """
+    Add the tank levels of a single dive profile as one column per tank.
+
+    Parameters:
+    - df: DataFrame containing the dive profile with a segment column.
+    - levels: Tank levels of this profile from compute_tank_levels.
+
+    Returns:
+    - polars dataframe with a bar_remaining_<tank> column per tank.
+    """
+    wide = levels.select(
+        "segment",
+        pl.format("bar_remaining_{}", "tank").alias("tank"),
+        "bar_remaining",
+    ).pivot(on="tank", index="segment", values="bar_remaining")
+    return df.drop(wide.columns[1:], strict=False).join(
+        wide, on="segment", how="left", maintain_order="left"
+    )
+
+
+def compute_tank_pressure(
+    df: pl.DataFrame, tanks: Mapping[str, tuple[float, float]]
+) -> pl.DataFrame:
+    """
+    Add the remaining pressure of every tank along the dive profile.
+
+    Parameters:
+    - df: DataFrame containing the dive profile with tank and conso_tank columns.
+    - tanks: Volume and pressure of each tank.
+
+    Returns:
+    - polars dataframe with a bar_remaining_<tank> column per tank, tanks not
+    breathed on a segment keep their pressure.
+    """
+    tanks = pl.DataFrame(
+        [(name, float(v), float(p)) for name, (v, p) in tanks.items()],
+        schema=["tank", "tank_volume", "tank_pressure"],
+        orient="row",
+    )
+    return widen_tank_levels(df, compute_tank_levels(df, tanks))
@@ -1,11 +1,13 @@
 # Import data from shared.py
 from abloc.src.plot import plot_profile, format_profile
-from abloc.src.utils import DiveProfile
+from abloc.src.utils import DiveProfile, ProfileHistory
+from abloc.src.api import create_api
 
 import polars as pl
 
 from shiny import App, render, ui, req, reactive
 from shinywidgets import output_widget, render_widget
+from starlette.routing import Mount
 import great_tables.shiny as gts
 from copy import copy
 from pathlib import Path
@@ -23,6 +25,18 @@ app_ui = ui.page_sidebar(
         ui.input_slider("volume", "Bloc (L)", 10, 30, 12, step=1),
         ui.input_slider("pressure", "Pression (bar)", 0, 300, 200, step=10),
         ui.input_switch("toggle_segment", "Edit mode", False),
+        ui.layout_columns(
+            ui.input_action_button(
+                "undo",
+                "Undo",
+                icon=ui.tags.i(class_="fa-solid fa-rotate-left"),
+            ),
+            ui.input_action_button(
+                "redo",
+                "Redo",
+                icon=ui.tags.i(class_="fa-solid fa-rotate-right"),
+            ),
+        ),
         ui.panel_conditional(
             "input.toggle_segment",
             ui.input_select(
@@ -47,6 +61,20 @@ app_ui = ui.page_sidebar(
                 ),
             ),
         ),
+        ui.input_switch("toggle_compare", "Compare mode", False),
+        ui.panel_conditional(
+            "input.toggle_compare",
+            ui.input_action_button(
+                "keep_scenario",
+                "Keep Scenario",
+                icon=ui.tags.i(class_="fa-solid fa-thumbtack"),
+            ),
+            ui.input_action_button(
+                "clear_scenarios",
+                "Clear Scenarios",
+                icon=ui.tags.i(class_="fa-solid fa-broom"),
+            ),
+        ),
     ),
     output_widget("profile_plot"),
     gts.output_gt("dive_profile"),
@@ -69,22 +97,73 @@ def server(input, output, session):
         volume=12,
         pressure=200,
     )
+    dp.update_conso()
+    history = ProfileHistory(dp)
     reactive_dp = reactive.value(dp)
     segment_list = reactive.value(dp.profile["segment"].to_list())
+    kept_scenarios = reactive.value({})
+
+    def commit(newdp: DiveProfile) -> None:
+        # record the new version and display it
+        history.push(newdp)
+        segment_list.set(newdp.profile["segment"].to_list())
+        reactive_dp.set(newdp)
+
+    def restore(olddp: DiveProfile) -> None:
+        # display a recorded version, its conso columns are already computed
+        ui.update_slider("volume", value=olddp.volume)
+        ui.update_slider("pressure", value=olddp.pressure)
+        segment_list.set(olddp.profile["segment"].to_list())
+        reactive_dp.set(olddp)
 
     @reactive.effect
     @reactive.event(input.volume, input.pressure)
     def _():
+        current = reactive_dp.get()
+        # sliders moved by restore already match the displayed version
+        if (input.volume(), input.pressure()) == (current.volume, current.pressure):
+            return
         # copy the class to trigger reactivity
-        newdp = copy(reactive_dp.get())
+        newdp = copy(current)
         newdp.volume = input.volume()
         newdp.pressure = input.pressure()
         newdp.update_conso()
-        reactive_dp.set(newdp)
+        commit(newdp)
+
+    @reactive.effect
+    @reactive.event(input.undo)
+    def _():
+        req(history.can_undo)
+        restore(history.undo())
+
+    @reactive.effect
+    @reactive.event(input.redo)
+    def _():
+        req(history.can_redo)
+        restore(history.redo())
+
+    @reactive.effect
+    @reactive.event(input.keep_scenario)
+    def _():
+        # recorded profiles are never modified, they can be kept as is
+        current = reactive_dp.get()
+        kept = kept_scenarios.get()
+        name = f"Scenario {len(kept) + 1} ({current.volume}L/{current.pressure}bar)"
+        kept_scenarios.set({**kept, name: current})
+
+    @reactive.effect
+    @reactive.event(input.clear_scenarios)
+    def _():
+        kept_scenarios.set({})
+
+    def displayed_profile() -> DiveProfile | dict[str, DiveProfile]:
+        if input.toggle_compare() and kept_scenarios.get():
+            return {**kept_scenarios.get(), "Current": reactive_dp.get()}
+        return reactive_dp.get()
 
     @render_widget
     def profile_plot():
-        return plot_profile(dp=reactive_dp.get())
+        return plot_profile(dp=displayed_profile())
 
     @reactive.effect
     @reactive.event(segment_list)
@@ -129,8 +208,7 @@ def server(input, output, session):
         )
         newdp.update_time()
         newdp.update_conso()
-        segment_list.set(newdp.profile["segment"].to_list())
-        reactive_dp.set(newdp)
+        commit(newdp)
 
     @reactive.effect
     @reactive.event(input.delete_segment)
@@ -142,12 +220,14 @@ def server(input, output, session):
         newdp.delete_segment(input.row_select())
         newdp.update_time()
         newdp.update_conso()
-        segment_list.set(newdp.profile["segment"].to_list())
-        reactive_dp.set(newdp)
+        commit(newdp)
 
     @gts.render_gt
     def dive_profile():
-        return format_profile(dp=reactive_dp.get())
+        return format_profile(dp=displayed_profile())
 
 
 app = App(app_ui, server)
+
+# serve the JSON planning API from the shiny app routes to keep its lifespan
+app.starlette_app.routes.insert(0, Mount("/api", app=create_api()))
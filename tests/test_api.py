@@ -0,0 +1,140 @@
+import pytest
+import asyncio
+import json
+from abloc.src import api
+from abloc.src import utils
+
+PROFILE = {"time": [5, 20, 10], "depth": [20, 20, 0], "conso": [20, 20, 20]}
+
+
+def post(app, payload: dict, headers: dict | None = None) -> tuple[int, dict, dict]:
+    # Send a POST /conso request to the ASGI app and collect the response
+    headers = headers or {}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(payload).encode()}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/conso",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "query_string": b"",
+    }
+    asyncio.run(app(scope, receive, send))
+    status = messages[0]["status"]
+    response_headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return status, response_headers, json.loads(body) if body else {}
+
+
+def test_conso_endpoint():
+    app = api.create_api()
+    status, headers, content = post(app, PROFILE)
+    assert status == 200
+    assert len(content["profiles"]) == 1
+    assert content["profiles"][0]["hash"] == api.hash_profile(PROFILE)
+    assert content["profiles"][0]["total_conso"] == 1800.0
+    assert [s["bar_remaining"] for s in content["profiles"][0]["segments"]][-1] == 50
+    assert "figure" not in content
+    assert headers["cache-control"] == "public, max-age=86400"
+
+    # Same request with matching ETag is not recomputed
+    status, _, content = post(app, PROFILE, headers={"if-none-match": headers["etag"]})
+    assert status == 304
+    assert content == {}
+
+
+def test_conso_endpoint_batch():
+    app = api.create_api()
+    other = {**PROFILE, "volume": 15, "pressure": 230}
+    status, _, content = post(app, {"profiles": [PROFILE, other], "figure": True})
+    assert status == 200
+    assert [p["total_conso"] for p in content["profiles"]] == [1800.0, 1800.0]
+    assert content["profiles"][1]["segments"][-1]["bar_remaining"] == 110.0
+    assert len(content["figure"]["data"]) == 4
+
+    # Duplicate profiles get one result each, in request order
+    status, _, content = post(app, {"profiles": [PROFILE, other, PROFILE]})
+    assert status == 200
+    assert [p["hash"] for p in content["profiles"]] == [
+        api.hash_profile(p) for p in [PROFILE, other, PROFILE]
+    ]
+
+    # Duplicate profiles get one scenario each in the figure
+    payload = {"profiles": [PROFILE, other, PROFILE], "figure": True}
+    status, _, content = post(app, payload)
+    names = [trace["name"] for trace in content["figure"]["data"]]
+    assert names[::2] == ["Scenario 1", "Scenario 2", "Scenario 3"]
+    status, _, content = post(app, {"profiles": [PROFILE, PROFILE], "figure": True})
+    assert len(content["figure"]["data"]) == 4, "Comparison of two scenarios"
+
+
+@pytest.mark.parametrize(
+    "profile",
+    [
+        {"time": [5, 20], "depth": [20], "conso": [20]},
+        {"time": [], "depth": [], "conso": []},
+        {"time": [1] * 27, "depth": [10] * 27, "conso": [20] * 27},
+        {"time": [5], "depth": [float("nan")], "conso": [20]},
+        {**PROFILE, "volume": 0},
+        {**PROFILE, "tank": ["Bloc", "Bloc", "Deco"], "tanks": {"Deco": [-7, 200]}},
+        {**PROFILE, "time": [1e308, 1e308, 1]},
+        {**PROFILE, "figure": "no"},
+    ],
+)
+def test_conso_endpoint_invalid(profile):
+    app = api.create_api()
+    status, _, content = post(app, profile)
+    assert status == 400
+    assert "error" in content
+
+
+def test_conso_batcher():
+    batcher = api.ConsoBatcher(max_wait=0.01)
+    dp = utils.DiveProfile(time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20])
+    other = utils.DiveProfile(time=[5, 10], depth=[20, 0], conso=[15, 15])
+
+    async def concurrent_requests():
+        return await asyncio.gather(
+            batcher.compute({"a": dp}),
+            batcher.compute({"a": dp, "b": other}),
+        )
+
+    first, second = asyncio.run(concurrent_requests())
+    assert first["a"] is second["a"], "Identical profiles are computed once"
+    assert second["b"][0]["conso_totale"][-1] == 450.0, "Profiles are not mixed"
+    assert list(batcher._cache) == ["a", "b"], "Computed profiles are cached"
+
+
+def test_compute_profiles_isolation():
+    dp = utils.DiveProfile(time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20])
+    bad = utils.DiveProfile(time=[5], depth=[20], conso=[20])
+    bad.profile = bad.profile.drop("depth")
+    results = api.compute_profiles({"good": dp, "bad": bad})
+    assert results["good"][0]["conso_totale"][-1] == 1800.0, "Good profile computed"
+    assert isinstance(results["bad"], Exception), "Bad profile fails alone"
+
+
+def test_compute_profiles_tanks():
+    dps = {
+        f"dive {i}": utils.DiveProfile(
+            time=[5, 20],
+            depth=[30, 0],
+            conso=[20, 20],
+            tank=[f"Stage {i}", "Bloc"],
+            extra_tanks={f"Stage {i}": (7, 200)},
+        )
+        for i in range(3)
+    }
+    results = api.compute_profiles(dps)
+    segments, levels = results["dive 1"]
+    assert [c for c in segments.columns if c.startswith("bar_remaining_")] == [
+        "bar_remaining_Bloc",
+        "bar_remaining_Stage 1",
+    ], "Only the tanks of the profile are widened"
+    assert levels["tank"].unique(maintain_order=True).to_list() == ["Bloc", "Stage 1"]
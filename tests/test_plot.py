@@ -34,3 +34,54 @@ def test_plot():
     # Test if the y-axis ranges are set correctly
     assert fig.layout.yaxis.range == (20.0, 0)  # Depth should be descending
     assert fig.layout.yaxis2.range == (0, 200.0)  # Bloc pressure should be ascending
+
+
+def test_plot_scenarios():
+    scenarios = {
+        f"{conso} L/min": utils.DiveProfile(
+            time=[5.0, 20.0, 10.0],
+            depth=[20.0, 20.0, 0.0],
+            conso=[conso] * 3,
+            volume=12,
+            pressure=200,
+        )
+        for conso in [15, 20, 25]
+    }
+
+    # Test if a collection of profiles gives an overlay plot
+    fig = plot.plot_profile(dp=scenarios)
+    assert isinstance(fig, go.FigureWidget)
+    # Test if each scenario has a depth and a pressure trace
+    data = fig.data
+    assert len(data) == 6
+    assert [trace.name for trace in data[::2]] == list(scenarios)
+    assert data[0].line.color == data[1].line.color
+    assert data[1].y[0] == 200.0  # Pressure trace starts full
+    assert fig.layout.title.text == "Dive Profile Comparison"
+    assert fig.layout.yaxis.range == (20.0, 0)
+    assert fig.layout.yaxis2.range == (0, 200.0)
+
+
+def test_plot_tanks():
+    dummy_dp = utils.DiveProfile(
+        time=[5.0, 20.0, 10.0],
+        depth=[40.0, 40.0, 0.0],
+        conso=[20, 20, 20],
+        volume=12,
+        pressure=200,
+        tank=["Bloc", "Bloc", "Deco"],
+        extra_tanks={"Deco": (7, 230)},
+    )
+    dummy_dp.update_conso()
+
+    # Test if each tank has its own pressure trace
+    fig = plot.plot_profile(dp=dummy_dp)
+    data = fig.data
+    assert [trace.name for trace in data] == [
+        "Depth",
+        "Bloc pressure",
+        "Deco pressure",
+        "Segment",
+    ]
+    assert list(data[2].y[:3]) == [230.0, 230.0, 230.0]  # Deco tank not breathed yet
+    assert fig.layout.yaxis2.range == (0, 230.0)
@@ -1,6 +1,7 @@
 import pytest
 import polars as pl
 import great_tables as gt
+from copy import copy
 from abloc.src import utils
 from abloc.src import plot
 
@@ -9,12 +10,13 @@ def test_diveprofile_class():
     dp = utils.DiveProfile(time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20])
     assert isinstance(dp, utils.DiveProfile), "DiveProfile class is correct"
     assert isinstance(dp.profile, utils.pl.DataFrame), "Profile is a polars DataFrame"
-    assert dp.profile.shape == (3, 5), "Profile has 3 rows and 5 columns"
+    assert dp.profile.shape == (3, 6), "Profile has 3 rows and 6 columns"
     assert dp.profile.columns == [
         "time_interval",
         "depth",
         "conso_per_min",
         "segment",
+        "tank",
         "time",
     ], "Profile has correct columns names"
     assert dp.profile["time"].to_list() == [5, 25, 35], "Time column is correct"
@@ -80,6 +82,7 @@ def test_update_segment():
         20,
         20,
         "B",
+        "Bloc",
         25,
     ), "Initial B segment is correct"
     dp.update_segment(segment="B", time_interval=30, depth=10, conso=10)
@@ -88,6 +91,7 @@ def test_update_segment():
         10,
         10,
         "B",
+        "Bloc",
         25,
     ), "New B segment is correct"
 
@@ -96,10 +100,10 @@ def test_delete_segment():
     dp = utils.DiveProfile(
         time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=12, pressure=200
     )
-    assert dp.profile.shape == (3, 5), "Initial profile has 3 rows"
+    assert dp.profile.shape == (3, 6), "Initial profile has 3 rows"
     dp.delete_segment(segment="B")
     assert "B" in dp.profile["segment"].to_list(), "B segment is reassign"
-    assert dp.profile.shape == (2, 5), "Profile has 2 rows after deletion"
+    assert dp.profile.shape == (2, 6), "Profile has 2 rows after deletion"
     with pytest.raises(ValueError):
         dp.delete_segment(segment="D")
 
@@ -126,3 +130,189 @@ def test_missing_columns():
     )
     with pytest.raises(ValueError):
         utils.compute_remaining_conso(df, volume=12, pressure=200)
+
+
+def test_profile_history():
+    dp = utils.DiveProfile(
+        time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=12, pressure=200
+    )
+    dp.update_conso()
+    history = utils.ProfileHistory(dp, max_versions=3)
+    assert history.current is dp, "Initial version is the initial profile"
+    assert not history.can_undo and not history.can_redo, "Nothing to undo or redo"
+    with pytest.raises(ValueError):
+        history.undo()
+
+    newdp = copy(dp)
+    newdp.update_segment(segment="B", time_interval=30, depth=10, conso=10)
+    newdp.update_time()
+    newdp.update_conso()
+    history.push(newdp)
+    assert history.version == 1, "New version is recorded"
+    assert dp.profile["time_interval"].to_list() == [5, 20, 10], "Old version kept"
+    assert history.undo() is dp, "Undo restores the previous version"
+    assert history.redo() is newdp, "Redo restores the next version"
+
+    # pushing after an undo drops the redo versions
+    history.undo()
+    history.push(copy(dp))
+    assert not history.can_redo, "Redo versions are dropped"
+    assert history.versions == [0, 1], "Redo version is replaced"
+
+    # oldest versions are evicted above max_versions
+    version_1 = history.current
+    history.push(copy(dp))
+    history.push(copy(dp))
+    assert history.versions == [1, 2, 3], "Oldest version is evicted"
+    with pytest.raises(ValueError):
+        history.goto(0)
+    assert history.goto(1) is version_1, "Jump to a specific version"
+    assert history.version == 1, "Current version is updated"
+
+    # oldest versions are evicted above max_bytes, the new one is kept
+    history = utils.ProfileHistory(dp, max_bytes=2 * dp.profile.estimated_size())
+    history.push(copy(dp))
+    history.push(copy(dp))
+    assert history.versions == [1, 2], "Oldest version is evicted"
+    assert history.size <= history.max_bytes, "History fits in max_bytes"
+    history = utils.ProfileHistory(dp, max_bytes=0)
+    history.push(newdp)
+    assert history.current is newdp and history.versions == [1], "New one is kept"
+
+
+def test_compute_scenarios():
+    dp = utils.DiveProfile(
+        time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=12, pressure=200
+    )
+    other = utils.DiveProfile(
+        time=[5, 10], depth=[20, 0], conso=[15, 15], volume=15, pressure=230
+    )
+    df = utils.compute_scenarios([dp, other])
+    assert df["scenario"].unique(maintain_order=True).to_list() == [
+        "Scenario 1",
+        "Scenario 2",
+    ], "Scenarios are named in order"
+    dp.update_conso()
+    assert (
+        df.filter(pl.col("scenario") == "Scenario 1")["bar_remaining"]
+        .round(6)
+        .to_list()
+        == dp.profile["bar_remaining"].round(6).to_list()
+    ), "Batched conso matches the single profile conso"
+    other.update_conso()
+    assert (
+        df.filter(pl.col("scenario") == "Scenario 2")["conso_totale"].to_list()
+        == other.profile["conso_totale"].to_list()
+    ), "Conso is not carried over between scenarios"
+    with pytest.raises(ValueError):
+        utils.compute_scenarios([])
+
+
+def test_format_scenarios():
+    dps = {
+        "12L": utils.DiveProfile(
+            time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=12
+        ),
+        "15L": utils.DiveProfile(
+            time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=15
+        ),
+    }
+    formatted_profile = plot.format_profile(dps)
+    assert isinstance(formatted_profile, gt.GT), "Formatted profile is a GT"
+    table = formatted_profile._tbl_data
+    assert table["scenario"].to_list() == ["12L", "15L"], "One row per scenario"
+    assert table["bar_remaining"].to_list() == [50.0, 80.0], "Final reserves"
+    assert table["bar_diff"].to_list() == [0.0, 30.0], "Difference with first"
+
+    # Reserves are clipped before computing the difference
+    dps["5L"] = utils.DiveProfile(
+        time=[5, 20, 10], depth=[20, 20, 0], conso=[20, 20, 20], volume=5
+    )
+    table = plot.format_profile(dps)._tbl_data
+    assert table["bar_remaining"].to_list() == [50.0, 80.0, 0.0], "Out of air"
+    assert table["bar_diff"].to_list() == [0.0, 30.0, -50.0], "Displayed difference"
+
+
+def test_multi_tank():
+    with pytest.raises(ValueError):
+        utils.DiveProfile(time=[5], depth=[20], conso=[20], tank=["Stage"])
+    dp = utils.DiveProfile(
+        time=[5, 20, 10],
+        depth=[20, 20, 0],
+        conso=[20, 20, 20],
+        volume=12,
+        pressure=200,
+        tank=["Bloc", "Bloc", "Deco"],
+        extra_tanks={"Deco": (7, 200), "Stage": (11, 200)},
+    )
+    assert list(dp.tanks) == ["Bloc", "Deco", "Stage"], "Main tank comes first"
+    dp.update_conso()
+    assert dp.total_conso == 1800.0, "Total conso includes all tanks"
+    assert dp.profile["conso_tank"].to_list() == [
+        200.0,
+        1400.0,
+        400.0,
+    ], "Conso is accumulated per tank"
+    assert dp.profile["bar_remaining"].round().to_list() == [
+        183.0,
+        83.0,
+        143.0,
+    ], "bar_remaining is the one of the breathed tank"
+    assert dp.profile["bar_remaining_Bloc"].round().to_list() == [183.0, 83.0, 83.0]
+    assert dp.profile["bar_remaining_Deco"].round().to_list() == [200.0, 200.0, 143.0]
+    assert dp.profile["bar_remaining_Stage"].to_list() == [200.0] * 3
+
+    dp.update_segment(segment="B", time_interval=20, depth=20, conso=20, tank="Stage")
+    assert dp.profile["tank"].to_list() == ["Bloc", "Stage", "Deco"], "Tank updated"
+    dp.update_segment(segment="D", time_interval=3, depth=0, conso=20)
+    assert dp.profile["tank"].to_list()[-1] == "Bloc", "New segment uses main tank"
+    with pytest.raises(ValueError):
+        dp.update_segment(segment="A", time_interval=5, depth=20, conso=20, tank="O2")
+
+    formatted_profile = plot.format_profile(dp)
+    assert {"tank", "bar_remaining_Deco"} <= set(
+        formatted_profile._tbl_data.columns
+    ), "Tank reserves are shown"
+
+
+def test_compute_scenarios_tanks():
+    dp = utils.DiveProfile(
+        time=[5, 20, 10],
+        depth=[20, 20, 0],
+        conso=[20, 20, 20],
+        tank=["Stage", "Bloc", "Bloc"],
+        extra_tanks={"Stage": (7, 230)},
+    )
+    other = utils.DiveProfile(time=[5, 10], depth=[20, 0], conso=[15, 15])
+    dps = {"stage": dp, "bloc": other}
+    df = utils.compute_scenarios(dps)
+    stage = df.filter(pl.col("scenario") == "stage")
+    assert stage["volume"].to_list() == [12.0] * 3, "Volume is the main tank one"
+    assert stage["tank_volume"].to_list() == [7.0, 12.0, 12.0], "Breathed tank"
+
+    levels = utils.compute_tank_levels(df, utils.scenario_tanks(dps), by="scenario")
+    assert levels.shape[0] == 3 * 2 + 2 * 1, "One row per segment and own tank"
+    dp.update_conso()
+    for tank in ["Bloc", "Stage"]:
+        assert (
+            levels.filter(pl.col("scenario") == "stage", pl.col("tank") == tank)[
+                "bar_remaining"
+            ]
+            .round(6)
+            .to_list()
+            == dp.profile[f"bar_remaining_{tank}"].round(6).to_list()
+        ), "Batched tank pressure matches the single profile one"
+
+
+def test_tank_names():
+    with pytest.raises(ValueError):
+        utils.DiveProfile(time=[5, 10], depth=[20, 0], conso=[20, 20], tank=["Bloc"])
+    dp = utils.DiveProfile(
+        time=[5, 10],
+        depth=[20, 0],
+        conso=[20, 20],
+        tank=["row", "Bloc"],
+        extra_tanks={"row": (7, 200)},
+    )
+    dp.update_conso()
+    assert dp.profile["bar_remaining_row"].round().to_list() == [171.0, 171.0]